@@ -0,0 +1,103 @@
+import time
+import logging
+from collections import OrderedDict, deque, namedtuple
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Снимок сообщения: ORM-объекты после закрытия сессии хранить нельзя
+CachedMessage = namedtuple('CachedMessage', ['id', 'user_id', 'message_text', 'created_at'])
+
+
+class RecentMessagesCache:
+    """
+    Кольцевой буфер последних сообщений каждого пользователя в памяти процесса.
+    Пополняется при записи сообщений, при промахе загружается из базы данных.
+    Общий объем ограничен, холодные пользователи вытесняются по LRU.
+    Буфер живет не дольше ttl секунд, чтобы подхватывать записи в обход бота
+    (например, импорт истории).
+    """
+
+    def __init__(self, db, per_user=10, max_users=10000, max_messages=50000, ttl=300):
+        self.db = db
+        self.per_user = per_user
+        self.max_users = max_users
+        self.max_messages = max_messages
+        self.ttl = ttl
+        self._buffers = OrderedDict()
+        self._expires_at = {}
+        self._total = 0
+
+    @staticmethod
+    def _snapshot(message):
+        return CachedMessage(
+            id=message.id,
+            user_id=message.user_id,
+            message_text=message.message_text,
+            created_at=message.created_at
+        )
+
+    def _evict(self):
+        """Вытеснение давно неактивных пользователей при превышении лимитов"""
+        while self._buffers and (len(self._buffers) > self.max_users or self._total > self.max_messages):
+            user_id, buffer = self._buffers.popitem(last=False)
+            self._expires_at.pop(user_id, None)
+            self._total -= len(buffer)
+            logger.debug(f"Буфер сообщений пользователя {user_id} вытеснен из кэша")
+
+    def _store(self, user_id, messages):
+        """Замена буфера пользователя; messages - от старых к новым"""
+        self.invalidate(user_id)
+        buffer = deque(messages, maxlen=self.per_user)
+        self._buffers[user_id] = buffer
+        self._expires_at[user_id] = time.monotonic() + self.ttl
+        self._total += len(buffer)
+        self._evict()
+
+    def get(self, user_id, limit=10):
+        """
+        Последние сообщения пользователя, от новых к старым (как get_user_messages).
+        При промахе сообщения загружаются из базы данных.
+        """
+        if limit > self.per_user:
+            return self.db.get_user_messages(user_id, limit=limit)
+
+        if user_id in self._buffers and time.monotonic() >= self._expires_at[user_id]:
+            self.invalidate(user_id)
+
+        buffer = self._buffers.get(user_id)
+        if buffer is not None:
+            self._buffers.move_to_end(user_id)
+            return list(reversed(buffer))[:limit]
+
+        messages = [self._snapshot(m) for m in self.db.get_user_messages(user_id, limit=self.per_user)]
+        # Пустой результат не кэшируем: get_user_messages возвращает [] и при ошибке БД
+        if messages:
+            self._store(user_id, reversed(messages))
+        return messages[:limit]
+
+    def add(self, message, new_user=False):
+        """
+        Добавление только что сохраненного сообщения.
+        Для пользователя, которого нет в кэше, буфер создается только если он новый
+        (истории в базе нет), иначе буфер будет заполнен из базы при первом чтении.
+        """
+        buffer = self._buffers.get(message.user_id)
+        if buffer is None:
+            if new_user:
+                self._store(message.user_id, [self._snapshot(message)])
+            return
+
+        if len(buffer) == buffer.maxlen:
+            self._total -= 1
+        buffer.append(self._snapshot(message))
+        self._total += 1
+        self._buffers.move_to_end(message.user_id)
+        self._evict()
+
+    def invalidate(self, user_id):
+        """Удаление буфера пользователя (например, после записи в обход бота)"""
+        buffer = self._buffers.pop(user_id, None)
+        self._expires_at.pop(user_id, None)
+        if buffer is not None:
+            self._total -= len(buffer)
@@ -6,6 +6,7 @@ from telegram.ext import ContextTypes, CommandHandler, MessageHandler, filters
 from sqlalchemy.exc import SQLAlchemyError
 from database import Database
 from models import Message, User
+from cache import RecentMessagesCache
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
@@ -13,6 +14,9 @@ logger = logging.getLogger(__name__)
 # Инициализация базы данных
 db = Database()
 
+# Последние сообщения пользователей для /mymessages
+recent_messages = RecentMessagesCache(db, per_user=10)
+
 
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
@@ -78,6 +82,7 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         session.add(start_message)
         session.commit()
+        recent_messages.add(start_message, new_user=existing_user is None)
 
     except SQLAlchemyError as e:
         session.rollback()
@@ -177,8 +182,8 @@ async def mymessages_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
     session = db.get_session()
     try:
-        # Получаем последние 10 сообщений пользователя
-        messages = db.get_user_messages(user.id, limit=10)
+        # Получаем последние 10 сообщений пользователя (из кэша, при промахе - из базы)
+        messages = recent_messages.get(user.id, limit=10)
 
         if not messages:
             await update.message.reply_text(
@@ -306,6 +311,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
         session.add(new_message)
         session.commit()
+        recent_messages.add(new_message, new_user=existing_user is None)
 
         # Формируем подтверждение пользователю
         message_id = new_message.id
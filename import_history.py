@@ -0,0 +1,461 @@
+import os
+import io
+import sys
+import json
+import time
+import hashlib
+import logging
+import argparse
+from datetime import datetime, timezone
+import ijson
+from sqlalchemy import text
+from database import Database
+from models import Message
+
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+
+logger = logging.getLogger(__name__)
+
+# Пути к массивам сообщений в экспорте Telegram Desktop:
+# экспорт одного чата и полный экспорт аккаунта
+TELEGRAM_PREFIXES = ('messages.item', 'chats.list.item.messages.item')
+
+MESSAGE_COLUMNS = ('user_id', 'username', 'first_name', 'last_name', 'message_text', 'created_at')
+USER_COLUMNS = ('user_id', 'username', 'first_name', 'last_name', 'created_at', 'last_seen')
+
+# Длины VARCHAR-колонок имен (одинаковы в messages и users): одно длинное имя
+# иначе роняет всю пачку COPY, и импорт не может продвинуться дальше нее
+NAME_LIMITS = {
+    field: Message.__table__.c[field].type.length
+    for field in ('username', 'first_name', 'last_name')
+}
+
+# Размер начального блока файла, по которому вычисляется ключ источника
+FINGERPRINT_BLOCK = 1024 * 1024
+
+
+def source_fingerprint(path):
+    """
+    Ключ источника для возобновления импорта: размер файла и SHA-256 первого блока.
+    Не зависит от пути, поэтому перемещенный файл продолжает загружаться с того же места.
+    """
+    with open(path, 'rb') as stream:
+        digest = hashlib.sha256(stream.read(FINGERPRINT_BLOCK)).hexdigest()
+    return f"{os.path.getsize(path)}:{digest}"
+
+
+def _fit_names(record):
+    """Обрезка имен до длины колонок"""
+    for field, limit in NAME_LIMITS.items():
+        if record[field]:
+            record[field] = record[field][:limit]
+    return record
+
+
+def iter_telegram_messages(stream):
+    """
+    Потоковый разбор result.json из Telegram Desktop.
+    В памяти находится только текущее сообщение, а не весь файл.
+    """
+    builder = None
+    current_prefix = None
+
+    for prefix, event, value in ijson.parse(stream):
+        if builder is None:
+            if prefix in TELEGRAM_PREFIXES and event == 'start_map':
+                builder = ijson.ObjectBuilder()
+                current_prefix = prefix
+                builder.event(event, value)
+            continue
+
+        builder.event(event, value)
+        if prefix == current_prefix and event == 'end_map':
+            record = _telegram_record(builder.value)
+            builder = None
+            yield record
+
+
+def _telegram_text(value):
+    """Текст в экспорте - строка или список строк и сущностей форматирования"""
+    if isinstance(value, str):
+        return value
+    parts = []
+    for part in value or []:
+        if isinstance(part, str):
+            parts.append(part)
+        elif isinstance(part, dict):
+            parts.append(part.get('text', ''))
+    return ''.join(parts)
+
+
+def _telegram_record(item):
+    """
+    Преобразование сообщения из экспорта Telegram в строку таблицы messages.
+    Служебные сообщения, сообщения каналов и сообщения без текста пропускаются (None).
+    """
+    from_id = item.get('from_id') or ''
+    if item.get('type') != 'message' or not from_id.startswith('user'):
+        return None
+
+    message_text = _telegram_text(item.get('text'))
+    if not message_text:
+        return None
+
+    if item.get('date_unixtime'):
+        created_at = datetime.fromtimestamp(int(item['date_unixtime']), tz=timezone.utc)
+    else:
+        # В старых экспортах только date - локальное время машины, где делался экспорт.
+        # Оставляем его без часового пояса, как и остальные наивные значения в схеме
+        created_at = datetime.fromisoformat(item['date'])
+
+    return _fit_names({
+        'user_id': int(from_id[len('user'):]),
+        'username': None,
+        'first_name': item.get('from'),
+        'last_name': None,
+        'message_text': message_text,
+        'created_at': created_at,
+    })
+
+
+def iter_jsonl_messages(stream):
+    """
+    Разбор выгрузки из старых систем: JSON Lines, по одному сообщению на строку
+    с полями таблицы messages.
+    """
+    for line in stream:
+        line = line.strip()
+        if not line:
+            yield None
+            continue
+
+        item = json.loads(line)
+        if not item.get('message_text'):
+            yield None
+            continue
+
+        created_at = datetime.fromisoformat(item['created_at'])
+
+        yield _fit_names({
+            'user_id': int(item['user_id']),
+            'username': item.get('username'),
+            'first_name': item.get('first_name'),
+            'last_name': item.get('last_name'),
+            'message_text': item['message_text'],
+            'created_at': created_at,
+        })
+
+
+def _comparable(value):
+    """Наивное (локальное) время приводится к aware только для сравнения внутри пачки"""
+    return value if value.tzinfo else value.astimezone()
+
+
+READERS = {
+    'telegram': (iter_telegram_messages, 'rb'),
+    'jsonl': (iter_jsonl_messages, 'rb'),
+}
+
+
+class HistoryImporter:
+    """
+    Загрузка истории сообщений пачками через COPY.
+    Каждая пачка (сообщения, пользователи и отметка прогресса) фиксируется
+    одной транзакцией, поэтому повторный запуск продолжает с последней
+    зафиксированной пачки без дубликатов.
+    """
+
+    def __init__(self, db, source_id, batch_size=50000):
+        self.db = db
+        self.source_id = source_id
+        self.batch_size = batch_size
+        self.connection = db.engine.raw_connection()
+
+    def _execute(self, sql, params=None):
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute(sql, params)
+            return cursor.fetchone() if cursor.description else None
+        finally:
+            cursor.close()
+
+    def prepare(self):
+        """Создание служебных таблиц: прогресс импорта и буфер пользователей"""
+        self._execute("""
+            CREATE TABLE IF NOT EXISTS import_progress (
+                source_id TEXT PRIMARY KEY,
+                records_done BIGINT NOT NULL,
+                updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        self._execute("""
+            CREATE TEMP TABLE IF NOT EXISTS import_users_stage (
+                LIKE users INCLUDING DEFAULTS
+            ) ON COMMIT DELETE ROWS
+        """)
+        self.connection.commit()
+
+    def get_records_done(self):
+        """Количество записей источника, уже загруженных в прошлых запусках"""
+        row = self._execute(
+            "SELECT records_done FROM import_progress WHERE source_id = %s",
+            (self.source_id,)
+        )
+        self.connection.commit()
+        return row[0] if row else 0
+
+    def reset_progress(self):
+        """Сброс прогресса; уже загруженные сообщения источника НЕ удаляются"""
+        self._execute("DELETE FROM import_progress WHERE source_id = %s", (self.source_id,))
+        self.connection.commit()
+
+    def drop_indexes(self):
+        """Удаление вторичных индексов messages на время загрузки"""
+        with self.db.engine.begin() as conn:
+            for index in Message.__table__.indexes:
+                index.drop(conn, checkfirst=True)
+        logger.info("Индексы таблицы messages удалены на время загрузки")
+
+    def restore_indexes(self):
+        """Пересоздание индексов messages после загрузки"""
+        # Отдельное соединение: основное может быть разорвано упавшей пачкой
+        with self.db.engine.begin() as conn:
+            for index in Message.__table__.indexes:
+                index.create(conn, checkfirst=True)
+        logger.info("Индексы таблицы messages пересозданы")
+
+    def analyze(self):
+        """Обновление статистики планировщика после загрузки"""
+        with self.db.engine.begin() as conn:
+            conn.execute(text("ANALYZE messages"))
+            conn.execute(text("ANALYZE users"))
+        logger.info("Статистика таблиц messages и users обновлена")
+
+    @staticmethod
+    def _csv_field(value):
+        """
+        Поле CSV для COPY: None - пустое поле без кавычек (NULL), строки - всегда в кавычках.
+        csv.writer оставляет без кавычек строку "\\.", а PostgreSQL считает ее концом данных.
+        """
+        if value is None:
+            return ''
+        if isinstance(value, str):
+            return '"' + value.replace('"', '""') + '"'
+        return str(value)
+
+    @classmethod
+    def _to_csv(cls, rows, columns):
+        buffer = io.StringIO()
+        for row in rows:
+            buffer.write(','.join(cls._csv_field(row[column]) for column in columns))
+            buffer.write('\n')
+        buffer.seek(0)
+        return buffer
+
+    def _copy(self, cursor, table, rows, columns):
+        cursor.copy_expert(
+            f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+            self._to_csv(rows, columns)
+        )
+
+    def _flush(self, rows, records_done):
+        """Запись одной пачки: COPY сообщений, upsert пользователей, отметка прогресса"""
+        # Дедупликация пользователей внутри пачки, между пачками - через ON CONFLICT
+        users = {}
+        for row in rows:
+            user = users.get(row['user_id'])
+            if user is None:
+                users[row['user_id']] = {
+                    'user_id': row['user_id'],
+                    'username': row['username'],
+                    'first_name': row['first_name'],
+                    'last_name': row['last_name'],
+                    'created_at': row['created_at'],
+                    'last_seen': row['created_at'],
+                }
+                continue
+            user['created_at'] = min(user['created_at'], row['created_at'], key=_comparable)
+            if _comparable(row['created_at']) >= _comparable(user['last_seen']):
+                user['last_seen'] = row['created_at']
+                for field in ('username', 'first_name', 'last_name'):
+                    user[field] = row[field] or user[field]
+
+        cursor = self.connection.cursor()
+        try:
+            self._copy(cursor, 'messages', rows, MESSAGE_COLUMNS)
+            self._copy(cursor, 'import_users_stage', users.values(), USER_COLUMNS)
+            cursor.execute("""
+                INSERT INTO users (user_id, username, first_name, last_name, created_at, last_seen)
+                SELECT user_id, username, first_name, last_name, created_at, last_seen
+                FROM import_users_stage
+                ON CONFLICT (user_id) DO UPDATE SET
+                    username = CASE WHEN EXCLUDED.last_seen >= users.last_seen
+                        THEN COALESCE(EXCLUDED.username, users.username) ELSE users.username END,
+                    first_name = CASE WHEN EXCLUDED.last_seen >= users.last_seen
+                        THEN COALESCE(EXCLUDED.first_name, users.first_name) ELSE users.first_name END,
+                    last_name = CASE WHEN EXCLUDED.last_seen >= users.last_seen
+                        THEN COALESCE(EXCLUDED.last_name, users.last_name) ELSE users.last_name END,
+                    created_at = LEAST(users.created_at, EXCLUDED.created_at),
+                    last_seen = GREATEST(users.last_seen, EXCLUDED.last_seen)
+            """)
+            cursor.execute("""
+                INSERT INTO import_progress (source_id, records_done, updated_at)
+                VALUES (%s, %s, CURRENT_TIMESTAMP)
+                ON CONFLICT (source_id) DO UPDATE SET
+                    records_done = EXCLUDED.records_done,
+                    updated_at = EXCLUDED.updated_at
+            """, (self.source_id, records_done))
+            self.connection.commit()
+        except BaseException:
+            # BaseException: при Ctrl-C транзакция тоже должна откатиться, иначе ее блокировка
+            # на messages не даст restore_indexes() пересоздать индексы
+            self.connection.rollback()
+            raise
+        finally:
+            cursor.close()
+
+        return len(users)
+
+    def run(self, records, stream, total_size, restart=False, drop_indexes=False):
+        """
+        Загрузка записей из итератора records (после prepare()).
+        records выдает словарь строки messages или None для пропущенной записи,
+        чтобы номер записи в источнике был стабилен между запусками.
+        """
+        if restart:
+            self.reset_progress()
+
+        skip = self.get_records_done()
+        if skip:
+            logger.info(f"Продолжение импорта {self.source_id}: пропуск {skip} уже загруженных записей")
+
+        if drop_indexes:
+            self.drop_indexes()
+
+        started = time.monotonic()
+        records_done = 0
+        inserted = 0
+        users_upserted = 0
+        batch = []
+
+        # Индексы восстанавливаются и при ошибке, и при прерывании (Ctrl-C):
+        # бот продолжает работать с этой же таблицей
+        try:
+            for record in records:
+                records_done += 1
+                if records_done <= skip:
+                    continue
+                if record is not None:
+                    batch.append(record)
+
+                if len(batch) >= self.batch_size:
+                    users_upserted += self._flush(batch, records_done)
+                    inserted += len(batch)
+                    batch = []
+                    self._report(stream, total_size, records_done, inserted, started)
+
+            if batch or records_done > skip:
+                users_upserted += self._flush(batch, records_done)
+                inserted += len(batch)
+            self._report(stream, total_size, records_done, inserted, started)
+        finally:
+            if drop_indexes:
+                self.restore_indexes()
+
+        self.analyze()
+
+        logger.info(
+            f"Импорт завершен: записей в источнике {records_done}, "
+            f"загружено сообщений {inserted}, обновлено пользователей {users_upserted}"
+        )
+        return inserted
+
+    @staticmethod
+    def _report(stream, total_size, records_done, inserted, started):
+        elapsed = max(time.monotonic() - started, 1e-6)
+        percent = stream.tell() * 100 / total_size if total_size else 100
+        logger.info(
+            f"Прогресс: {percent:.1f}% | записей {records_done} | "
+            f"загружено {inserted} | {inserted / elapsed:.0f} сообщ/с"
+        )
+
+    def close(self):
+        self.connection.close()
+
+
+def _positive_int(value):
+    number = int(value)
+    if number <= 0:
+        raise argparse.ArgumentTypeError(f"ожидается положительное число, получено {value}")
+    return number
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Импорт истории сообщений из экспорта Telegram Desktop или JSON Lines"
+    )
+    parser.add_argument('path', help="Путь к файлу экспорта (result.json или .jsonl)")
+    parser.add_argument('--format', choices=sorted(READERS), default='telegram',
+                        help="Формат файла (по умолчанию telegram)")
+    parser.add_argument('--batch-size', type=_positive_int, default=50000,
+                        help="Количество сообщений в одной пачке COPY")
+    parser.add_argument('--source-id', default=None,
+                        help="Ключ для возобновления импорта "
+                             "(по умолчанию размер файла и SHA-256 его первого мегабайта)")
+    parser.add_argument('--restart', action='store_true',
+                        help="Начать импорт заново, игнорируя сохраненный прогресс. "
+                             "Уже загруженные сообщения не удаляются и будут вставлены повторно, "
+                             "поэтому при наличии прогресса требуется --accept-duplicates")
+    parser.add_argument('--accept-duplicates', action='store_true',
+                        help="Подтвердить повторную вставку уже загруженных сообщений при --restart")
+    parser.add_argument('--drop-indexes', action='store_true',
+                        help="Удалить индексы messages на время загрузки и пересоздать после "
+                             "(только если бот не работает с этой базой)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    if not os.path.isfile(args.path):
+        logger.error(f"Файл не найден: {args.path}")
+        sys.exit(1)
+
+    reader, mode = READERS[args.format]
+    source_id = args.source_id or source_fingerprint(args.path)
+    total_size = os.path.getsize(args.path)
+
+    db = Database()
+    importer = HistoryImporter(db, source_id, batch_size=args.batch_size)
+    try:
+        importer.prepare()
+
+        records_done = importer.get_records_done()
+        if args.restart and records_done and not args.accept_duplicates:
+            logger.error(
+                f"Из источника {source_id} уже загружено {records_done} записей. "
+                f"--restart вставит их повторно (сообщения не удаляются); "
+                f"добавьте --accept-duplicates, если это ожидаемо"
+            )
+            sys.exit(1)
+
+        with open(args.path, mode) as stream:
+            importer.run(
+                reader(stream),
+                stream,
+                total_size,
+                restart=args.restart,
+                drop_indexes=args.drop_indexes
+            )
+    except KeyboardInterrupt:
+        logger.info("Импорт прерван, повторный запуск продолжит с последней пачки")
+        sys.exit(1)
+    finally:
+        importer.close()
+
+
+if __name__ == '__main__':
+    main()